@@ -1,22 +1,58 @@
+import os
 import random
 import uuid
-import json
 import asyncio
-from typing import Dict, List, Optional, AsyncGenerator, Any
+import hashlib
+from functools import lru_cache
+import msgspec
+from typing import Dict, List, Optional, AsyncGenerator, Any, Union
 from datetime import datetime
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, ORJSONResponse
 from pydantic import BaseModel
-from sqlalchemy import create_engine, Column, String, DateTime, ForeignKey, Text
+from sqlalchemy import create_engine, Column, String, DateTime, ForeignKey, Text, Index, Boolean, func, select, update, insert, lambda_stmt
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.orm import sessionmaker, Session, relationship, selectinload, load_only
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.dialects.postgresql import UUID
 
 # Configuration de la base de données PostgreSQL
 DATABASE_URL = "sqlite:///./chatbot.db" # Changer pour PostgreSQL si nécessaire avec l'image Docker
-engine = create_engine(DATABASE_URL)
+ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./chatbot.db" # postgresql+asyncpg://... avec PostgreSQL
+
+# Taille des pools PostgreSQL, par moteur et par processus worker.
+# Connexions max par worker : (5 + 5) pour le moteur sync + (5 + 5) pour le moteur async = 20,
+# soit 80 avec les 4 workers par défaut, sous le max_connections=100 de PostgreSQL.
+# Ajuster ces valeurs si WEB_CONCURRENCY augmente.
+SYNC_POOL_SIZE, SYNC_MAX_OVERFLOW = 5, 5     # routes synchrones (threadpool de FastAPI)
+ASYNC_POOL_SIZE, ASYNC_MAX_OVERFLOW = 5, 5   # /chat/stream uniquement
+
+# Paramètres du pool de connexions selon la base utilisée
+def engine_options(url: str, pool_size: int, max_overflow: int) -> Dict[str, Any]:
+    if url.startswith("sqlite+aiosqlite"):
+        # Par défaut aiosqlite ouvre une nouvelle connexion à chaque session (NullPool)
+        return {"poolclass": AsyncAdaptedQueuePool}
+    if url.startswith("sqlite"):
+        # Les connexions du pool sont réutilisées par les différents threads de FastAPI
+        return {"connect_args": {"check_same_thread": False}}
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_pre_ping": True,
+        "pool_recycle": 1800
+    }
+
+engine = create_engine(
+    DATABASE_URL, **engine_options(DATABASE_URL, SYNC_POOL_SIZE, SYNC_MAX_OVERFLOW)
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Moteur asynchrone pour les routes async (ne bloque pas la boucle d'événements)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL, ASYNC_POOL_SIZE, ASYNC_MAX_OVERFLOW)
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 # Modèles SQLAlchemy avec support pour PostgreSQL UUID
@@ -30,19 +66,27 @@ class Conversation(Base):
     __tablename__ = "conversations"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
-    sport = Column(String)
+    sport = Column(String, index=True)
     created_at = Column(DateTime, default=datetime.now)
+    messages = relationship("Message", order_by="Message.created_at")
+
+    # Index pour lister les conversations d'un utilisateur, les plus récentes en premier
+    __table_args__ = (
+        Index("ix_conversations_user_created", user_id, created_at.desc()),
+    )
 
 class Message(Base):
     __tablename__ = "messages"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     conversation_id = Column(UUID(as_uuid=True), ForeignKey("conversations.id"))
-    is_user = Column(String)  # "true" ou "false"
+    is_user = Column(Boolean, nullable=False, default=False)
     content = Column(Text)
     created_at = Column(DateTime, default=datetime.now)
 
-# Création des tables
-Base.metadata.create_all(bind=engine)
+    # Index pour récupérer les messages d'une conversation déjà triés par date
+    __table_args__ = (
+        Index("ix_messages_conversation_created", "conversation_id", "created_at"),
+    )
 
 # Modèles Pydantic
 class UserCreate(BaseModel):
@@ -80,12 +124,25 @@ class ConversationResponse(BaseModel):
     class Config:
         orm_mode = True
 
+# Conversation sans ses messages (historique avec include_messages=false)
+class ConversationSummaryResponse(BaseModel):
+    id: uuid.UUID
+    sport: str
+    created_at: datetime
+
 class ChatStreamRequest(BaseModel):
     user_id: uuid.UUID
     sport: str
     content: str
     conversation_id: Optional[uuid.UUID] = None
 
+# En-tête envoyé avant la réponse en streaming (struct msgspec : pas de dict ni de validation)
+class StreamHeader(msgspec.Struct):
+    message_id: uuid.UUID
+    conversation_id: uuid.UUID
+
+stream_header_encoder = msgspec.json.Encoder()
+
 # Dépendance pour obtenir la session DB
 def get_db():
     db = SessionLocal()
@@ -94,7 +151,12 @@ def get_db():
     finally:
         db.close()
 
-app = FastAPI()
+# Dépendance pour obtenir une session DB asynchrone
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Configuration CORS
 app.add_middleware(
@@ -105,18 +167,60 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configuration pour gérer les UUID
-class UUIDEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, uuid.UUID):
-            # Si l'objet est un UUID, le convertir en string
-            return str(obj)
-        return json.JSONEncoder.default(self, obj)
+# Création des tables au démarrage, uniquement si demandé (CREATE_TABLES=1)
+@app.on_event("startup")
+def init_db():
+    if os.environ.get("CREATE_TABLES") == "1":
+        Base.metadata.create_all(bind=engine)
+
+# Fermeture des connexions du pool asynchrone à l'arrêt
+# (chaque connexion aiosqlite garde un thread qui empêcherait le processus de se terminer)
+@app.on_event("shutdown")
+async def close_db():
+    await async_engine.dispose()
+
+# Conversion des modèles SQLAlchemy en dict (orjson sérialise nativement UUID et datetime)
+def user_to_dict(user: User) -> Dict[str, Any]:
+    return {
+        "id": user.id,
+        "username": user.username,
+        "created_at": user.created_at
+    }
+
+def message_to_dict(msg: Message) -> Dict[str, Any]:
+    return {
+        "id": msg.id,
+        "content": msg.content,
+        "is_user": msg.is_user,
+        "created_at": msg.created_at
+    }
+
+def conversation_to_dict(conv: Conversation, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "id": conv.id,
+        "sport": conv.sport,
+        "messages": messages,
+        "created_at": conv.created_at
+    }
+
+# Les requêtes des routes sont écrites avec lambda_stmt : la construction et la
+# compilation SQL sont mises en cache, seules les valeurs des paramètres changent
+
+# Vérification d'existence d'un utilisateur : seule la clé primaire est lue
+def user_exists(db: Session, user_id: uuid.UUID) -> bool:
+    stmt = lambda_stmt(lambda: select(User.id).where(User.id == user_id))
+    return db.execute(stmt).first() is not None
+
+async def async_user_exists(db: AsyncSession, user_id: uuid.UUID) -> bool:
+    stmt = lambda_stmt(lambda: select(User.id).where(User.id == user_id))
+    return (await db.execute(stmt)).first() is not None
+
+# Route de vérification de santé (réponse pré-sérialisée, aucun encodage à chaque appel)
+_PING = Response(content=b'{"ping":"pong!"}', media_type="application/json")
 
-# Route de vérification de santé
 @app.get("/ping")
 def pong():
-    return {"ping": "pong!"}
+    return _PING
 
 # Réponses prédéfinies par sport
 sport_responses = {
@@ -152,162 +256,193 @@ sport_responses = {
     ]
 }
 
+# Sports supportés et réponses déjà découpées en mots pour le streaming (calculés une seule fois)
+SPORTS = frozenset(sport_responses)
+sport_words = {
+    sport: [response.split() for response in responses]
+    for sport, responses in sport_responses.items()
+}
+
+# Cache des réponses : un même message pour un même sport reçoit la même réponse
+@lru_cache(maxsize=4096)
+def pick_response(sport: str, content_hash: str) -> int:
+    return random.randrange(len(sport_responses[sport]))
+
+def get_response_index(sport: str, content: str) -> int:
+    # Le hash borne la taille des clés du cache quelle que soit la longueur du message
+    normalized = " ".join(content.lower().split())
+    content_hash = hashlib.blake2b(normalized.encode(), digest_size=8).hexdigest()
+    return pick_response(sport, content_hash)
+
+def get_bot_response(sport: str, content: str) -> str:
+    return sport_responses[sport][get_response_index(sport, content)]
+
 # Routes pour les utilisateurs
-@app.post("/users/", response_model=UserResponse)
+@app.post("/users/", responses={200: {"model": UserResponse}})
 def create_user(user: UserCreate, db: Session = Depends(get_db)):
     db_user = User(username=user.username)
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
-    return db_user
+    return ORJSONResponse(content=user_to_dict(db_user))
 
-@app.get("/users/{user_id}", response_model=UserResponse)
+@app.get("/users/{user_id}", responses={200: {"model": UserResponse}})
 def get_user(user_id: uuid.UUID, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.id == user_id).first()
+    db_user = db.execute(lambda_stmt(
+        lambda: select(User)
+        .options(load_only(User.id, User.username, User.created_at))
+        .where(User.id == user_id)
+    )).scalar_one_or_none()
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return db_user
+    return ORJSONResponse(content=user_to_dict(db_user))
 
 # Routes pour les conversations
-@app.post("/chat/", response_model=Dict)
+@app.post("/chat/")
 def send_message(message: MessageCreate, db: Session = Depends(get_db)):
-    # Vérifier si l'utilisateur existe
-    user = db.query(User).filter(User.id == message.user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Vérifier si le sport est valide
+    # Vérifier si le sport est valide (avant toute requête en base)
     sport = message.sport.lower()
-    if sport not in sport_responses:
+    if sport not in SPORTS:
         raise HTTPException(status_code=400, detail="Sport not supported")
     
     # Créer ou récupérer une conversation existante
-    conversation = None
+    user_id = message.user_id
     if message.conversation_id:
-        conversation = db.query(Conversation).filter(
-            Conversation.id == message.conversation_id,
-            Conversation.user_id == message.user_id
-        ).first()
+        # Utilisateur et conversation vérifiés en une seule requête
+        requested_id = message.conversation_id
+        conversation_id = db.execute(lambda_stmt(
+            lambda: select(Conversation.id)
+            .join(User, User.id == Conversation.user_id)
+            .where(Conversation.id == requested_id, User.id == user_id)
+        )).scalar_one_or_none()
         
-        if not conversation:
+        if conversation_id is None:
+            # Distinguer un utilisateur inexistant d'une conversation introuvable
+            if not user_exists(db, user_id):
+                raise HTTPException(status_code=404, detail="User not found")
             raise HTTPException(status_code=404, detail="Conversation not found")
     else:
-        conversation = Conversation(user_id=message.user_id, sport=sport)
+        # Vérifier si l'utilisateur existe
+        if not user_exists(db, user_id):
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        conversation = Conversation(user_id=user_id, sport=sport)
         db.add(conversation)
-        db.commit()
-        db.refresh(conversation)
-    
-    # Enregistrer le message de l'utilisateur
-    user_message = Message(
-        conversation_id=conversation.id,
-        is_user="true",
-        content=message.content
-    )
-    db.add(user_message)
-    
-    # Générer et enregistrer la réponse du bot
-    response_content = random.choice(sport_responses[sport])
-    bot_message = Message(
-        conversation_id=conversation.id,
-        is_user="false",
-        content=response_content
-    )
-    db.add(bot_message)
+        db.flush()
+        conversation_id = conversation.id
     
+    # Message de l'utilisateur et réponse du bot, avec ID et date générés ici :
+    # un seul INSERT pour les deux et aucun rafraîchissement nécessaire après le commit
+    user_message = {
+        "id": uuid.uuid4(),
+        "conversation_id": conversation_id,
+        "is_user": True,
+        "content": message.content,
+        "created_at": datetime.now()
+    }
+    bot_message = {
+        "id": uuid.uuid4(),
+        "conversation_id": conversation_id,
+        "is_user": False,
+        "content": get_bot_response(sport, message.content),
+        "created_at": datetime.now()
+    }
+    db.execute(insert(Message), [user_message, bot_message])
     db.commit()
-    db.refresh(bot_message)
     
     # Créer la réponse avec l'ID de conversation
-    response = MessageResponse(
-        id=bot_message.id,
-        content=bot_message.content,
-        is_user=False,
-        created_at=bot_message.created_at
-    )
-    
-    # Ajouter l'ID de conversation à la réponse
-    response_dict = json.loads(json.dumps(response.dict(), cls=UUIDEncoder))
-    response_dict["conversation_id"] = str(conversation.id)
-    
-    return response_dict
+    return ORJSONResponse(content=bot_message)
 
-@app.get("/history/{user_id}", response_model=List[ConversationResponse])
-def get_history(user_id: uuid.UUID, db: Session = Depends(get_db)):
+@app.get(
+    "/history/{user_id}",
+    responses={200: {"model": Union[List[ConversationResponse], List[ConversationSummaryResponse]]}}
+)
+def get_history(
+    user_id: uuid.UUID,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    include_messages: bool = True,
+    db: Session = Depends(get_db)
+):
+    """Récupère une page des conversations d'un utilisateur, les plus récentes en premier"""
     # Vérifier si l'utilisateur existe
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
+    if not user_exists(db, user_id):
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Récupérer toutes les conversations de l'utilisateur
-    conversations = db.query(Conversation).filter(Conversation.user_id == user_id).all()
-    
-    result = []
-    for conv in conversations:
-        messages = db.query(Message).filter(Message.conversation_id == conv.id).all()
-        message_responses = [
-            MessageResponse(
-                id=msg.id,
-                content=msg.content,
-                is_user=True if msg.is_user == "true" else False,
-                created_at=msg.created_at
-            ) for msg in messages
-        ]
+    if not include_messages:
+        # Métadonnées seules (liste des conversations) : aucune requête sur les messages
+        conversations = db.execute(lambda_stmt(
+            lambda: select(Conversation.id, Conversation.sport, Conversation.created_at)
+            .where(Conversation.user_id == user_id)
+            .order_by(Conversation.created_at.desc())
+            .limit(limit)
+            .offset(offset)
+        )).all()
         
-        result.append(
-            ConversationResponse(
-                id=conv.id,
-                sport=conv.sport,
-                messages=message_responses,
-                created_at=conv.created_at
-            )
-        )
+        return ORJSONResponse(content=[
+            {"id": conv.id, "sport": conv.sport, "created_at": conv.created_at}
+            for conv in conversations
+        ])
+    
+    # Récupérer la page de conversations avec leurs messages
+    # (une seule requête supplémentaire pour tous les messages, pas une par conversation)
+    conversations = db.execute(lambda_stmt(
+        lambda: select(Conversation)
+        .options(selectinload(Conversation.messages))
+        .where(Conversation.user_id == user_id)
+        .order_by(Conversation.created_at.desc())
+        .limit(limit)
+        .offset(offset)
+    )).scalars().all()
     
-    return result
+    result = [
+        conversation_to_dict(conv, [message_to_dict(msg) for msg in conv.messages])
+        for conv in conversations
+    ]
+    
+    return ORJSONResponse(content=result)
 
-@app.get("/conversation/{conversation_id}", response_model=ConversationResponse)
+@app.get("/conversation/{conversation_id}", responses={200: {"model": ConversationResponse}})
 def get_conversation(conversation_id: uuid.UUID, db: Session = Depends(get_db)):
     """Récupère une conversation spécifique avec tous ses messages"""
     # Chercher la conversation
-    conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+    conversation = db.execute(lambda_stmt(
+        lambda: select(Conversation).where(Conversation.id == conversation_id)
+    )).scalar_one_or_none()
     
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    # Récupérer tous les messages de la conversation
-    messages = db.query(Message).filter(Message.conversation_id == conversation_id).all()
+    # Récupérer tous les messages de la conversation, triés par date de création
+    messages = db.execute(lambda_stmt(
+        lambda: select(Message)
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.created_at)
+    )).scalars().all()
     
     # Transformer les messages en format de réponse
-    message_responses = [
-        MessageResponse(
-            id=msg.id,
-            content=msg.content,
-            is_user=True if msg.is_user == "true" else False,
-            created_at=msg.created_at
-        ) for msg in messages
-    ]
-    
-    # Trier les messages par date de création
-    message_responses.sort(key=lambda x: x.created_at)
+    message_responses = [message_to_dict(msg) for msg in messages]
     
     # Construire et retourner la réponse complète
-    return ConversationResponse(
-        id=conversation.id,
-        sport=conversation.sport,
-        messages=message_responses,
-        created_at=conversation.created_at
-    )
+    return ORJSONResponse(content=conversation_to_dict(conversation, message_responses))
 
 @app.get("/admin/stats")
 def get_stats(db: Session = Depends(get_db)):
-    user_count = db.query(User).count()
-    conversation_count = db.query(Conversation).count()
-    message_count = db.query(Message).count()
+    # Compteurs globaux en une seule requête
+    user_count, conversation_count, message_count = db.query(
+        select(func.count()).select_from(User).scalar_subquery(),
+        select(func.count()).select_from(Conversation).scalar_subquery(),
+        select(func.count()).select_from(Message).scalar_subquery()
+    ).one()
     
-    # Stats par sport
-    sport_stats = {}
-    for sport in sport_responses.keys():
-        sport_conversations = db.query(Conversation).filter(Conversation.sport == sport).count()
-        sport_stats[sport] = sport_conversations
+    # Stats par sport en un seul GROUP BY (0 pour les sports sans conversation)
+    sport_stats = {sport: 0 for sport in sport_responses}
+    sport_stats.update(
+        db.query(Conversation.sport, func.count())
+        .filter(Conversation.sport.in_(SPORTS))
+        .group_by(Conversation.sport)
+        .all()
+    )
     
     return {
         "user_count": user_count,
@@ -316,84 +451,89 @@ def get_stats(db: Session = Depends(get_db)):
         "sport_stats": sport_stats
     }
 
+# Nombre de mots envoyés par morceau et délai entre deux morceaux
+STREAM_CHUNK_WORDS = 3
+STREAM_CHUNK_DELAY = 0.05
+
 # Fonction simulant la génération de réponse progressive
-async def generate_streaming_response(sport: str) -> AsyncGenerator[str, None]:
-    # Réponses prédéfinies par sport (on utilise celles existantes)
-    response = random.choice(sport_responses[sport])
-    
-    # Pour simuler un envoi mot par mot, on divise la réponse en mots
-    words = response.split()
-    for word in words:
-        yield word + " "
-        # Petit délai entre les mots pour simuler une réponse progressive
-        await asyncio.sleep(0.1)
+async def generate_streaming_response(sport: str, content: str) -> AsyncGenerator[str, None]:
+    # Réponses prédéfinies par sport, déjà découpées en mots
+    words = sport_words[sport][get_response_index(sport, content)]
+    # On envoie les mots par petits groupes : moins de réveils de la boucle et d'envois réseau
+    for i in range(0, len(words), STREAM_CHUNK_WORDS):
+        if i:
+            # Petit délai entre les morceaux pour simuler une réponse progressive
+            await asyncio.sleep(STREAM_CHUNK_DELAY)
+        yield " ".join(words[i:i + STREAM_CHUNK_WORDS]) + " "
 
 # Route pour le chat avec streaming
 @app.post("/chat/stream")
-async def chat_stream(request: ChatStreamRequest, db: Session = Depends(get_db)):
-    # Vérifier si l'utilisateur existe
-    user = db.query(User).filter(User.id == request.user_id).first()
-    if not user:
-        return StreamingResponse(content=iter(["Utilisateur non trouvé"]), media_type="text/plain")
-    
-    # Vérifier si le sport est valide
+async def chat_stream(request: ChatStreamRequest, db: AsyncSession = Depends(get_async_db)):
+    # Vérifier si le sport est valide (avant toute requête en base)
     sport = request.sport.lower()
-    if sport not in sport_responses:
+    if sport not in SPORTS:
         return StreamingResponse(content=iter(["Sport non pris en charge"]), media_type="text/plain")
 
     # Récupérer ou créer une conversation
-    conversation = None
+    user_id = request.user_id
+    conversation_id = None
     if request.conversation_id:
-        conversation = db.query(Conversation).filter(
-            Conversation.id == request.conversation_id,
-            Conversation.user_id == request.user_id
-        ).first()
+        # Utilisateur et conversation vérifiés en une seule requête
+        requested_id = request.conversation_id
+        conversation_id = (await db.execute(lambda_stmt(
+            lambda: select(Conversation.id)
+            .join(User, User.id == Conversation.user_id)
+            .where(Conversation.id == requested_id, User.id == user_id)
+        ))).scalar_one_or_none()
     
-    if not conversation:
-        conversation = Conversation(user_id=request.user_id, sport=sport)
+    if conversation_id is None:
+        # Vérifier si l'utilisateur existe avant de créer une nouvelle conversation
+        if not await async_user_exists(db, user_id):
+            return StreamingResponse(content=iter(["Utilisateur non trouvé"]), media_type="text/plain")
+        
+        conversation = Conversation(user_id=user_id, sport=sport)
         db.add(conversation)
-        db.commit()
-        db.refresh(conversation)
+        await db.flush()
+        conversation_id = conversation.id
     
-    # Enregistrer le message de l'utilisateur
+    # Enregistrer le message de l'utilisateur et un message vide pour la réponse du bot
     user_message = Message(
-        conversation_id=conversation.id,
-        is_user="true",
+        conversation_id=conversation_id,
+        is_user=True,
         content=request.content
     )
-    db.add(user_message)
-    db.commit()
-    
-    # Créer un message vide pour la réponse du bot
     bot_message = Message(
-        conversation_id=conversation.id,
-        is_user="false",
+        conversation_id=conversation_id,
+        is_user=False,
         content=""  # Sera mis à jour après le streaming
     )
-    db.add(bot_message)
-    db.commit()
-    db.refresh(bot_message)
+    db.add_all([user_message, bot_message])
+    
+    # Un seul commit pour la conversation et les deux messages
+    await db.commit()
     
     # Information à envoyer au frontend avant le streaming
-    header_info = {
-        "message_id": str(bot_message.id),
-        "conversation_id": str(conversation.id)
-    }
+    bot_message_id = bot_message.id
+    header = stream_header_encoder.encode(StreamHeader(bot_message_id, conversation_id)) + b"\n"
     
     # Yield l'information d'en-tête en premier, puis les mots
     async def generate_response():
-        yield json.dumps(header_info) + "\n"
+        yield header
         
         full_response = ""
-        async for word in generate_streaming_response(sport):
+        async for word in generate_streaming_response(sport, request.content):
             full_response += word
             yield word
         
         # Mettre à jour le message dans la base de données avec la réponse complète
-        db_message = db.query(Message).filter(Message.id == bot_message.id).first()
-        if db_message:
-            db_message.content = full_response.strip()
-            db.commit()
+        # (la session de la requête est déjà fermée pendant le streaming)
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                update(Message)
+                .where(Message.id == bot_message_id)
+                .values(content=full_response.strip())
+            )
+            await session.commit()
     
     return StreamingResponse(
         content=generate_response(),
@@ -402,4 +542,19 @@ async def chat_stream(request: ChatStreamRequest, db: Session = Depends(get_db))
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    # DEV=1 : rechargement automatique (un seul processus)
+    # Sinon : plusieurs workers (WEB_CONCURRENCY), avec uvloop et httptools
+    dev = os.getenv("DEV") == "1"
+    # Création des tables une seule fois ici, avant le lancement des workers :
+    # sinon chaque worker exécuterait create_all en même temps au démarrage
+    if os.environ.pop("CREATE_TABLES", None) == "1":
+        Base.metadata.create_all(bind=engine)
+    uvicorn.run(
+        "app.main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=1 if dev else int(os.getenv("WEB_CONCURRENCY", 4)),
+        loop="auto",
+        http="auto",
+        reload=dev
+    )
\ No newline at end of file